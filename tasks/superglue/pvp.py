@@ -13,12 +13,12 @@
 """
 This file contains the pattern-verbalizer pairs (PVPs) for all tasks.
 """
-import copy
 import math
 import random
 import string
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from functools import cached_property
+from itertools import chain
 from typing import Tuple, List, Union, Dict
 import numpy as np
 
@@ -26,7 +26,29 @@ from tasks.data_utils import InputExample, num_special_tokens_to_add, build_inpu
     build_decoder_input, build_decoder_sample
 from utils import print_rank_0
 
-FilledPattern = Tuple[List[Union[str, Tuple[str, bool]]], List[Union[str, Tuple[str, bool]]]]
+PatternPart = Union[str, List[int], Tuple[Union[str, List[int]], bool]]
+FilledPattern = Tuple[List[PatternPart], List[PatternPart]]
+
+
+class _Slot(object):
+    """Placeholder for a segment of a pattern template that is only known once the pattern is applied"""
+
+    def __init__(self, name, field=None, prefix=''):
+        self.name = name
+        self.field = field
+        self.prefix = prefix
+
+    def fill(self, example: InputExample) -> Tuple[str, bool]:
+        """Return the shortenable example text for this slot"""
+        return self.prefix + getattr(example, self.field), True
+
+    def __repr__(self):
+        return self.name
+
+
+TEXT_A, TEXT_B, MASK = _Slot('TEXT_A', 'text_a'), _Slot('TEXT_B', 'text_b'), _Slot('MASK')
+# same as TEXT_A and TEXT_B with a space in front of the text
+SPACE_TEXT_A, SPACE_TEXT_B = _Slot('SPACE_TEXT_A', 'text_a', prefix=' '), _Slot('SPACE_TEXT_B', 'text_b', prefix=' ')
 
 
 class PVP(ABC):
@@ -34,6 +56,10 @@ class PVP(ABC):
     This class contains functions to apply patterns and verbalizers as required by PET. Each task requires its own
     custom implementation of a PVP.
     """
+    # Pattern templates indexed by pattern id, for tasks whose patterns only place the (shortenable) text_a, text_b
+    # and the mask between fixed strings. Each template is a pair of lists for parts_a and parts_b that may contain
+    # strings, the TEXT_A, TEXT_B, SPACE_TEXT_A, SPACE_TEXT_B and MASK slots and None for continuous prompt tokens.
+    PATTERNS = None
 
     def __init__(self, args, tokenizer, label_list, max_seq_length, pattern_id: int = 0, verbalizer_file: str = None,
                  seed: int = 42, is_multi_token=False, max_segment_length=0, fast_decode: bool = False, split='train',
@@ -53,7 +79,9 @@ class PVP(ABC):
         """
         self.args = args
         self.tokenizer = tokenizer
+        self._mask_id = tokenizer.get_command('MASK').Id if tokenizer is not None else None
         self.label_list = label_list
+        self._label_to_index = {label: idx for idx, label in enumerate(label_list)}
         self.max_seq_length = max_seq_length
         self.pattern_id = pattern_id
         self.num_prompt_tokens = num_prompt_tokens
@@ -73,6 +101,10 @@ class PVP(ABC):
         if verbalizer_file:
             self.verbalize = PVP._load_verbalizer_from_file(verbalizer_file, self.pattern_id)
 
+        self._template = None
+        if self.PATTERNS is not None and tokenizer is not None:
+            self._template = self._compile_template()
+
     @property
     def is_multi_token(self):
         return self._is_multi_token
@@ -84,14 +116,14 @@ class PVP(ABC):
     @property
     def mask(self) -> str:
         """Return the underlying LM's mask token"""
-        return self.tokenizer.get_command('MASK').Id
+        return self._mask_id
 
     @property
     def mask_id(self) -> int:
         """Return the underlying LM's mask id"""
-        return self.tokenizer.get_command('MASK').Id
+        return self._mask_id
 
-    @property
+    @cached_property
     def max_num_verbalizers(self) -> int:
         """Return the maximum number of verbalizers across all labels"""
         return max(len(self.verbalize(label)) for label in self.label_list)
@@ -105,21 +137,21 @@ class PVP(ABC):
     def remove_final_punc(s: Union[str, Tuple[str, bool]]):
         """Remove the final punctuation mark"""
         if isinstance(s, tuple):
-            return PVP.remove_final_punc(s[0]), s[1]
+            return s[0].rstrip(string.punctuation), s[1]
         return s.rstrip(string.punctuation)
 
     @staticmethod
     def lowercase_first(s: Union[str, Tuple[str, bool]]):
         """Lowercase the first character"""
         if isinstance(s, tuple):
-            return PVP.lowercase_first(s[0]), s[1]
+            return s[0][0].lower() + s[0][1:], s[1]
         return s[0].lower() + s[1:]
 
     @staticmethod
     def uppercase_first(s: Union[str, Tuple[str, bool]]):
         """Lowercase the first character"""
         if isinstance(s, tuple):
-            return PVP.uppercase_first(s[0]), s[1]
+            return s[0][0].upper() + s[0][1:], s[1]
         return s[0].upper() + s[1:]
 
     @staticmethod
@@ -206,7 +238,7 @@ class PVP(ABC):
         if self.is_multi_token:
             answers = self.get_answers(example)
             if example.label is not None:
-                label = self.label_list.index(example.label)
+                label = self._label_to_index[example.label]
             else:
                 label = 0
 
@@ -215,26 +247,30 @@ class PVP(ABC):
                 segment_id_list = []
                 if priming:
                     answer = answers[label]
-                    answer_ids = get_verbalization_ids(answer, tokenizer, force_single_token=False)
+                    answer_ids = self.get_answer_ids(answer)
                     self.num_truncated += self.truncate(parts_a, parts_b, answer_ids, max_length=self.max_seq_length)
-                    tokens_a = [token_id for part, _ in parts_a for token_id in part]
-                    tokens_b = [token_id for part, _ in parts_b for token_id in part] if parts_b else None
+                    tokens_a, mask_idx = self._join_parts(parts_a)
+                    tokens_b, mask_idx_b = self._join_parts(parts_b) if parts_b else (None, -1)
+                    if mask_idx < 0 and mask_idx_b >= 0:
+                        mask_idx = len(tokens_a) + mask_idx_b
                     input_ids = tokens_a
                     if tokens_b:
                         input_ids += tokens_b
                     if labeled:
-                        mask_idx = input_ids.index(self.mask_id)
+                        if mask_idx < 0:
+                            raise ValueError("mask id {} is not in input_ids".format(self.mask_id))
                         input_ids = input_ids[:mask_idx] + answer_ids + input_ids[mask_idx + 1:]
                     return input_ids
                 else:
                     for idx, answer in enumerate(answers):
-                        this_parts_a, this_parts_b = copy.deepcopy(parts_a), copy.deepcopy(parts_b)
-                        answer_ids = get_verbalization_ids(answer, tokenizer, force_single_token=False)
+                        # truncate only replaces the (ids, shortenable) tuples, so a shallow copy keeps parts intact
+                        this_parts_a, this_parts_b = list(parts_a), list(parts_b) if parts_b else parts_b
+                        answer_ids = self.get_answer_ids(answer)
                         answer_ids = answer_ids + [tokenizer.get_command('eop').Id]
                         self.num_truncated += self.truncate(this_parts_a, this_parts_b, answer_ids,
                                                             max_length=self.max_seq_length)
-                        tokens_a = [token_id for part, _ in this_parts_a for token_id in part]
-                        tokens_b = [token_id for part, _ in this_parts_b for token_id in part] if parts_b else None
+                        tokens_a, mask_pos_a = self._join_parts(this_parts_a)
+                        tokens_b, mask_pos_b = self._join_parts(this_parts_b) if parts_b else (None, -1)
                         if self.max_segment_length > 0:
                             num_segments = (len(answer_ids) - 1) // self.max_segment_length + 1
                             segments = [
@@ -250,30 +286,31 @@ class PVP(ABC):
                                                         args=self.args, add_cls=True, add_sep=False, add_piece=True,
                                                         mask_id=self.mask_id)
                             ids, types, paddings, position_ids, sep, target_ids, loss_masks = data
-                            prompt_pos = [idx for idx, token in enumerate(ids) if token == prompt_id]
-                            ids = [idx if idx != prompt_id else 0 for idx in ids]
+                            ids, prompt_pos = _replace_prompt_ids(ids, prompt_id)
                             prompt_list.append(prompt_pos)
                             ids_list.append(ids)
                             positions_list.append(position_ids)
                             sep_list.append(sep)
                             target_list.append(target_ids)
                             mask_list.append(loss_masks)
-                            if self.mask in tokens_a:
-                                mask_pos = tokens_a.index(self.mask)
-                                tokens_a = tokens_a[:mask_pos] + segment + tokens_a[mask_pos:]
+                            if mask_pos_a >= 0:
+                                tokens_a = tokens_a[:mask_pos_a] + segment + tokens_a[mask_pos_a:]
+                                mask_pos_a += len(segment)
                             else:
-                                mask_pos = tokens_b.index(self.mask)
-                                tokens_b = tokens_b[:mask_pos] + segment + tokens_b[mask_pos:]
+                                if mask_pos_b < 0:
+                                    raise ValueError("mask id {} is not in input_ids".format(self.mask_id))
+                                tokens_b = tokens_b[:mask_pos_b] + segment + tokens_b[mask_pos_b:]
+                                mask_pos_b += len(segment)
                     segment_id_list = segment_id_list if segment_id_list else None
                     sample = build_sample(ids_list, positions=positions_list, masks=sep_list, label=label,
                                           logit_mask=mask_list, target=target_list,
                                           unique_id=example.guid, segment_ids=segment_id_list, prompt_ids=prompt_list)
                     return sample
             else:
-                this_parts_a, this_parts_b = copy.deepcopy(parts_a), copy.deepcopy(parts_b)
+                this_parts_a, this_parts_b = list(parts_a), list(parts_b) if parts_b else parts_b
                 self.num_truncated += self.truncate(this_parts_a, this_parts_b, None, max_length=self.max_seq_length)
-                tokens_a = [token_id for part, _ in this_parts_a for token_id in part]
-                tokens_b = [token_id for part, _ in this_parts_b for token_id in part] if parts_b else None
+                tokens_a = list(chain.from_iterable(part for part, _ in this_parts_a))
+                tokens_b = list(chain.from_iterable(part for part, _ in this_parts_b)) if parts_b else None
                 data = build_input_from_ids(tokens_a, tokens_b, None, self.max_seq_length, self.tokenizer,
                                             args=self.args, add_cls=True, add_sep=False, add_piece=False)
                 ids, types, paddings, position_ids, sep, target_ids, loss_masks = data
@@ -281,7 +318,7 @@ class PVP(ABC):
 
                 ids_list, positions_list, mask_list, target_list, logit_mask_list = [], [], [], [], []
                 for answer in answers:
-                    answer_ids = get_verbalization_ids(answer, tokenizer, force_single_token=False)
+                    answer_ids = self.get_answer_ids(answer)
                     answer_ids = answer_ids + [tokenizer.get_command('eop').Id]
                     answer_ids = answer_ids[:self.max_dec_seq_length]
                     data = build_decoder_input(ids, answer_ids, self.max_seq_length, self.max_dec_seq_length, tokenizer)
@@ -298,14 +335,17 @@ class PVP(ABC):
         else:
             self.num_truncated += self.truncate(parts_a, parts_b, [], max_length=self.max_seq_length)
 
-            tokens_a = [token_id for part, _ in parts_a for token_id in part]
-            tokens_b = [token_id for part, _ in parts_b for token_id in part] if parts_b else None
+            tokens_a, mask_idx = self._join_parts(parts_a)
+            tokens_b, mask_idx_b = self._join_parts(parts_b) if parts_b else (None, -1)
             if priming:
+                if mask_idx < 0 and mask_idx_b >= 0:
+                    mask_idx = len(tokens_a) + mask_idx_b
                 input_ids = tokens_a
                 if tokens_b:
                     input_ids += tokens_b
                 if labeled:
-                    mask_idx = input_ids.index(self.mask_id)
+                    if mask_idx < 0:
+                        raise ValueError("mask id {} is not in input_ids".format(self.mask_id))
                     verbalizer = self.verbalize(example.label)
                     assert len(verbalizer) == 1, 'priming only supports one verbalization per label'
                     verbalizer = verbalizer[0]
@@ -315,25 +355,63 @@ class PVP(ABC):
             data = build_input_from_ids(tokens_a, tokens_b, None, self.max_seq_length, self.tokenizer, args=self.args,
                                         add_cls=True, add_sep=False, add_piece=True)
             ids, types, paddings, position_ids, sep, target_ids, loss_masks = data
-            prompt_pos = [idx for idx, token in enumerate(ids) if token == prompt_id]
-            ids = [token if token != prompt_id else 0 for token in ids]
+            ids, prompt_pos = _replace_prompt_ids(ids, prompt_id)
             target_ids = self.get_verbalizer_ids()
             if example.label is not None:
-                label = self.label_list.index(example.label)
+                label = self._label_to_index[example.label]
             else:
                 label = 0
             sample = build_sample(ids=ids, positions=position_ids, target=target_ids, masks=sep, logit_mask=loss_masks,
                                   label=label, unique_id=example.guid, prompt_ids=prompt_pos)
             return sample
 
+    def _compile_template(self):
+        """Tokenize the fixed strings and the mask of this PVP's pattern template once"""
+        if not 0 <= self.pattern_id < len(self.PATTERNS):
+            raise ValueError("No pattern implemented for id {}".format(self.pattern_id))
+        compiled = []
+        for parts in self.PATTERNS[self.pattern_id]:
+            compiled_parts = []
+            for x in parts:
+                if x is MASK:
+                    x = ([self.mask], False)
+                elif isinstance(x, str):
+                    x = (self.tokenizer.EncodeAsIds(x).tokenization, False)
+                compiled_parts.append(x)
+            compiled.append(compiled_parts)
+        return tuple(compiled)
+
+    def _fill_template(self, example: InputExample) -> FilledPattern:
+        """Apply the compiled pattern template to an example, only text_a and text_b are tokenized later on"""
+        parts_a, parts_b = ([x.fill(example) if isinstance(x, _Slot) else x for x in parts] for parts in self._template)
+        return parts_a, parts_b
+
+    def _join_parts(self, parts: List[Tuple[List[int], bool]]) -> Tuple[List[int], int]:
+        """Concatenate the token ids of all parts, return them with the position of the mask (-1 if not found)"""
+        tokens, mask_idx = [], -1
+        for part, _ in parts:
+            if mask_idx < 0 and len(part) == 1 and part[0] == self.mask_id:
+                mask_idx = len(tokens)
+            tokens.extend(part)
+        return tokens, mask_idx
+
     @staticmethod
     def _seq_length(parts: List[Tuple[List[int], bool]], only_shortenable: bool = False):
-        return sum([len(x) for x, shortenable in parts if not only_shortenable or shortenable]) if parts else 0
+        return sum(len(x) for x, shortenable in parts if not only_shortenable or shortenable) if parts else 0
 
     @staticmethod
-    def _remove_last(parts: List[Tuple[List[int], bool]]):
-        last_idx = max(idx for idx, (seq, shortenable) in enumerate(parts) if shortenable and seq)
-        parts[last_idx] = (parts[last_idx][0][:-1], parts[last_idx][1])
+    def _remove_last(parts: List[Tuple[List[int], bool]], num_tokens: int = 1):
+        """Remove the last ``num_tokens`` tokens of the shortenable parts, walking the parts once from the end"""
+        idx = len(parts)
+        while num_tokens > 0 and idx > 0:
+            idx -= 1
+            seq, shortenable = parts[idx]
+            if shortenable and seq:
+                num_removed = min(num_tokens, len(seq))
+                parts[idx] = (seq[:-num_removed], shortenable)
+                num_tokens -= num_removed
+        if num_tokens > 0:
+            raise ValueError("Not enough shortenable tokens to truncate")
 
     def truncate(self, parts_a: List[Tuple[List[int], bool]], parts_b: List[Tuple[List[int], bool]], answer: List[int],
                  max_length: int):
@@ -347,13 +425,29 @@ class PVP(ABC):
         if num_tokens_to_remove <= 0:
             return False
 
-        for _ in range(num_tokens_to_remove):
-            if self._seq_length(parts_a, only_shortenable=True) > self._seq_length(parts_b, only_shortenable=True):
-                self._remove_last(parts_a)
-            else:
-                self._remove_last(parts_b)
+        len_a = self._seq_length(parts_a, only_shortenable=True)
+        len_b = self._seq_length(parts_b, only_shortenable=True)
+        keep_a, keep_b = self._truncated_lengths(len_a, len_b, num_tokens_to_remove)
+        if len_b > keep_b:
+            self._remove_last(parts_b, len_b - keep_b)
+        if len_a > keep_a:
+            self._remove_last(parts_a, len_a - keep_a)
         return True
 
+    @staticmethod
+    def _truncated_lengths(len_a: int, len_b: int, num_tokens_to_remove: int) -> Tuple[int, int]:
+        """
+        Compute the shortenable lengths of both sequences after truncation. Tokens are removed one at a time from the
+        sequence with the longer shortenable part (from the second one on ties), so the longer side is cut down to the
+        shorter one first and both are shortened alternately afterwards.
+        """
+        if len_a > len_b and num_tokens_to_remove <= len_a - len_b:
+            return len_a - num_tokens_to_remove, len_b
+        if len_a <= len_b and num_tokens_to_remove <= len_b - len_a:
+            return len_a, len_b - num_tokens_to_remove
+        total_len = len_a + len_b - num_tokens_to_remove
+        return (total_len + 1) // 2, total_len // 2
+
     @abstractmethod
     def get_parts(self, example: InputExample) -> FilledPattern:
         """
@@ -362,14 +456,31 @@ class PVP(ABC):
         single sequence of text, the second sequence should be an empty list.
 
         :param example: the input example to process
-        :return: Two sequences of text. All text segments can optionally be marked as being shortenable.
+        :return: Two sequences of segments. Each segment is either a string or a list of token ids (e.g. the mask or a
+                 pre-tokenized template literal), and can optionally be marked as being shortenable.
         """
         pass
 
     def get_answers(self, example: InputExample):
         return [self.verbalize(label)[0] for label in self.label_list]
 
+    def get_answer_ids(self, answer: str) -> List[int]:
+        """Return the token ids of an answer, answers that are verbalizations of a label are only tokenized once"""
+        answer_ids = self._verbalization_ids.get(answer)
+        if answer_ids is None:
+            answer_ids = get_verbalization_ids(answer, self.tokenizer, force_single_token=False)
+        return answer_ids
+
+    @cached_property
+    def _verbalization_ids(self) -> Dict[str, List[int]]:
+        return {verbalizer: get_verbalization_ids(verbalizer, self.tokenizer, force_single_token=False)
+                for label in self.label_list for verbalizer in self.verbalize(label)}
+
     def get_verbalizer_ids(self):
+        return self._verbalizer_ids
+
+    @cached_property
+    def _verbalizer_ids(self) -> List[int]:
         target_ids = []
         for label in self.label_list:
             verbalizer = self.verbalize(label)[0]
@@ -387,16 +498,19 @@ class PVP(ABC):
         """
         pass
 
-    def get_mask_positions(self, input_ids: List[int]) -> List[int]:
-        label_idx = input_ids.index(self.mask_id)
-        labels = [-1] * len(input_ids)
+    def get_mask_positions(self, input_ids: List[int]) -> np.ndarray:
+        input_ids = np.asarray(input_ids)
+        label_idx = np.argmax(input_ids == self.mask_id)
+        if input_ids[label_idx] != self.mask_id:
+            raise ValueError("mask id {} is not in input_ids".format(self.mask_id))
+        labels = np.full(len(input_ids), -1, dtype=np.int64)
         labels[label_idx] = 1
         return labels
 
     @staticmethod
     def _load_verbalizer_from_file(path: str, pattern_id: int):
 
-        verbalizers = defaultdict(dict)  # type: Dict[int, Dict[str, List[str]]]
+        verbalizers = {}  # type: Dict[int, Dict[str, List[str]]]
         current_pattern_id = None
 
         with open(path, 'r') as fh:
@@ -405,12 +519,13 @@ class PVP(ABC):
                     current_pattern_id = int(line)
                 elif line:
                     label, *realizations = line.split()
-                    verbalizers[current_pattern_id][label] = realizations
+                    verbalizers.setdefault(current_pattern_id, {})[label] = realizations
 
-        print_rank_0("Automatically loaded the following verbalizer: \n {}".format(verbalizers[pattern_id]))
+        pattern_verbalizers = verbalizers.get(pattern_id, {})
+        print_rank_0("Automatically loaded the following verbalizer: \n {}".format(pattern_verbalizers))
 
         def verbalize(label) -> List[str]:
-            return verbalizers[pattern_id][label]
+            return pattern_verbalizers[label]
 
         return verbalize
 
@@ -428,18 +543,6 @@ class CopaPVP(PVP):
     def spell_length(self):
         return self.num_prompt_tokens + self.prefix_prompt
 
-    @property
-    def mask(self) -> str:
-        """Return the underlying LM's mask token"""
-        mask_token = 'MASK'
-        return self.tokenizer.get_command(mask_token).Id
-
-    @property
-    def mask_id(self) -> int:
-        """Return the underlying LM's mask id"""
-        mask_token = 'MASK'
-        return self.tokenizer.get_command(mask_token).Id
-
     def get_answers(self, example: InputExample):
         choice1 = " " + self.remove_final_punc(self.lowercase_first(example.meta['choice1']))
         choice2 = " " + self.remove_final_punc(self.lowercase_first(example.meta['choice2']))
@@ -507,7 +610,7 @@ class CopaPVP(PVP):
             parts = [(tokenizer.EncodeAsIds(x).tokenization if isinstance(x, str) else x, s) for x, s in parts if
                      x]
             self.num_truncated += self.truncate(parts, None, answer_ids, max_length=self.max_seq_length)
-            tokens_a = [token_id for part, _ in parts for token_id in part]
+            tokens_a = list(chain.from_iterable(part for part, _ in parts))
             data = build_input_from_ids(tokens_a, None, answer_ids, self.max_seq_length, self.tokenizer, args=self.args,
                                         add_cls=True, add_sep=False, add_piece=True)
             ids, types, paddings, position_ids, sep, target_ids, loss_masks = data
@@ -517,7 +620,7 @@ class CopaPVP(PVP):
             target_list.append(target_ids)
             mask_list.append(loss_masks)
         if example.label is not None:
-            label = self.label_list.index(example.label)
+            label = self._label_to_index[example.label]
         else:
             label = 0
         sample = build_sample(ids_list, positions=positions_list, masks=sep_list, label=label,
@@ -620,21 +723,20 @@ class WscPVP(PVP):
             raw_parts_b = [x if isinstance(x, tuple) else (x, False) for x in raw_parts_b]
             parts_b = encode_input(raw_parts_b)
         answer = self.get_answers(example)[0]
-        answer_ids = get_verbalization_ids(answer, tokenizer, force_single_token=False)
+        answer_ids = self.get_answer_ids(answer)
         answer_ids = answer_ids + [tokenizer.get_command('eop').Id]
         self.num_truncated += self.truncate(parts_a, parts_b, answer_ids, max_length=self.max_seq_length)
-        tokens_a = [token_id for part, _ in parts_a for token_id in part]
-        tokens_b = [token_id for part, _ in parts_b for token_id in part] if parts_b else None
+        tokens_a = list(chain.from_iterable(part for part, _ in parts_a))
+        tokens_b = list(chain.from_iterable(part for part, _ in parts_b)) if parts_b else None
         data = build_input_from_ids(tokens_a, tokens_b, answer_ids, self.max_seq_length, self.tokenizer, args=self.args,
                                     add_cls=True, add_sep=False, add_piece=True)
         ids, types, paddings, position_ids, sep, target_ids, loss_masks = data
-        prompt_pos = [idx for idx, token in enumerate(ids) if token == prompt_id]
-        ids = [token if token != prompt_id else 0 for token in ids]
+        ids, prompt_pos = _replace_prompt_ids(ids, prompt_id)
         if example.label is not None:
-            label = self.label_list.index(example.label)
+            label = self._label_to_index[example.label]
         else:
             label = 0
-        return {'text': np.array(ids, dtype=np.int64), 'target': np.array(target_ids, dtype=np.int64),
+        return {'text': ids, 'target': np.array(target_ids, dtype=np.int64),
                 'attention_mask': np.array(sep, dtype=np.int64), 'loss_mask': np.array(loss_masks, dtype=np.int64),
                 "position_id": np.array(position_ids, dtype=np.int64),
                 'prompt_pos': np.array(prompt_pos, dtype=np.int64), 'label': label, 'uid': example.guid}
@@ -785,6 +887,15 @@ class BoolQPVP(PVP):
         "true": [" true"]
     }
 
+    PATTERNS = (
+        ([None, TEXT_A, None, ' Question:', SPACE_TEXT_B, '? Answer:', None, MASK, '.'], []),
+        ([None, TEXT_A, None, ' Question:', SPACE_TEXT_B, '? Answer:', None, MASK, '.'], []),
+        ([None, TEXT_A, ' Based on the previous passage,', None, SPACE_TEXT_B, '?', None, MASK, '.'], []),
+        ([None, TEXT_A, ' Based on the previous passage,', None, SPACE_TEXT_B, '?', None, MASK, '.'], []),
+        (['Based on the following passage', None, SPACE_TEXT_B, '?', None, MASK, '.', None, SPACE_TEXT_A], []),
+        (['Based on the following passage', None, SPACE_TEXT_B, '?', None, MASK, '.', None, SPACE_TEXT_A], []),
+    )
+
     @staticmethod
     def available_patterns():
         return [0, 1, 2, 3, 4, 5]
@@ -794,20 +905,7 @@ class BoolQPVP(PVP):
         return self.num_prompt_tokens + self.prefix_prompt
 
     def get_parts(self, example: InputExample) -> FilledPattern:
-        passage = example.text_a
-        question = example.text_b
-
-        if self.pattern_id < 2:
-            parts_a, parts_b = [None, self.shortenable(passage), None, ' Question:', self.shortenable(" " + question),
-                                '? Answer:', None, [self.mask], '.'], []
-        elif self.pattern_id < 4:
-            parts_a, parts_b = [None, self.shortenable(passage), ' Based on the previous passage,', None,
-                                self.shortenable(" " + question), '?', None, [self.mask], '.'], []
-        elif self.pattern_id < 6:
-            parts_a, parts_b = ['Based on the following passage', None, self.shortenable(" " + question), '?', None,
-                                [self.mask], '.', None, self.shortenable(" " + passage)], []
-        else:
-            raise NotImplementedError(self.pattern_id)
+        parts_a, parts_b = self._fill_template(example)
         parts_a, parts_b = self.replace_prompt_tokens(parts_a, parts_b)
         return parts_a, parts_b
 
@@ -912,29 +1010,21 @@ class AgnewsPVP(PVP):
         "4": [" Tech"]
     }
 
+    PATTERNS = (
+        ([MASK, ':', TEXT_A, TEXT_B], []),
+        ([MASK, ' News:', TEXT_A, TEXT_B], []),
+        ([TEXT_A, '(', MASK, ')', TEXT_B], []),
+        ([TEXT_A, TEXT_B, '(', MASK, ')'], []),
+        (['[ Category:', MASK, ']', TEXT_A, TEXT_B], []),
+        ([MASK, '-', TEXT_A, TEXT_B], []),
+    )
+
     @staticmethod
     def available_patterns():
         return [0, 1, 2, 3, 4, 5]
 
     def get_parts(self, example: InputExample) -> FilledPattern:
-
-        text_a = self.shortenable(example.text_a)
-        text_b = self.shortenable(example.text_b)
-
-        if self.pattern_id == 0:
-            return [[self.mask], ':', text_a, text_b], []
-        elif self.pattern_id == 1:
-            return [[self.mask], ' News:', text_a, text_b], []
-        elif self.pattern_id == 2:
-            return [text_a, '(', [self.mask], ')', text_b], []
-        elif self.pattern_id == 3:
-            return [text_a, text_b, '(', [self.mask], ')'], []
-        elif self.pattern_id == 4:
-            return ['[ Category:', [self.mask], ']', text_a, text_b], []
-        elif self.pattern_id == 5:
-            return [[self.mask], '-', text_a, text_b], []
-        else:
-            raise ValueError("No pattern implemented for id {}".format(self.pattern_id))
+        return self._fill_template(example)
 
     def verbalize(self, label) -> List[str]:
         return AgnewsPVP.VERBALIZER[label]
@@ -954,29 +1044,21 @@ class YahooPVP(PVP):
         "10": [" Politics"],
     }
 
+    PATTERNS = (
+        ([MASK, ':', TEXT_A, TEXT_B], []),
+        ([MASK, ' Question:', TEXT_A, TEXT_B], []),
+        ([TEXT_A, '(', MASK, ')', TEXT_B], []),
+        ([TEXT_A, TEXT_B, '(', MASK, ')'], []),
+        (['[ Category:', MASK, ']', TEXT_A, TEXT_B], []),
+        ([MASK, '-', TEXT_A, TEXT_B], []),
+    )
+
     @staticmethod
     def available_patterns():
         return [0, 1, 2, 3, 4, 5]
 
     def get_parts(self, example: InputExample) -> FilledPattern:
-
-        text_a = self.shortenable(example.text_a)
-        text_b = self.shortenable(example.text_b)
-
-        if self.pattern_id == 0:
-            return [[self.mask], ':', text_a, text_b], []
-        elif self.pattern_id == 1:
-            return [[self.mask], ' Question:', text_a, text_b], []
-        elif self.pattern_id == 2:
-            return [text_a, '(', [self.mask], ')', text_b], []
-        elif self.pattern_id == 3:
-            return [text_a, text_b, '(', [self.mask], ')'], []
-        elif self.pattern_id == 4:
-            return ['[ Category:', [self.mask], ']', text_a, text_b], []
-        elif self.pattern_id == 5:
-            return [[self.mask], '-', text_a, text_b], []
-        else:
-            raise ValueError("No pattern implemented for id {}".format(self.pattern_id))
+        return self._fill_template(example)
 
     def verbalize(self, label) -> List[str]:
         return YahooPVP.VERBALIZER[label]
@@ -1030,16 +1112,16 @@ class TNewsPVP(PVP):
                     "115": ["农业"],
                     "116": ["游戏"]}
 
+    PATTERNS = (
+        (["标题：", TEXT_A, "关键词：", TEXT_B, "类别：", MASK], []),
+    )
+
     @staticmethod
     def available_patterns():
         return [0]
 
     def get_parts(self, example: InputExample) -> FilledPattern:
-        text_a, text_b = self.shortenable(example.text_a), self.shortenable(example.text_b)
-        if self.pattern_id == 0:
-            return ["标题：", text_a, "关键词：", text_b, "类别：", [self.mask]], []
-        else:
-            raise NotImplementedError("No pattern implemented for id {}".format(self.pattern_id))
+        return self._fill_template(example)
 
     def verbalize(self, label) -> List[str]:
         if self.pattern_id == 0:
@@ -1054,18 +1136,17 @@ class AFQMCPVP(PVP):
         "1": ["▁是"]
     }
 
+    PATTERNS = (
+        ([TEXT_A, "？"], ["你是说", TEXT_B, "？", MASK, "。"]),
+        ([TEXT_A, "？"], [MASK, '，', TEXT_B]),
+    )
+
     @staticmethod
     def available_patterns():
         return [0, 1]
 
     def get_parts(self, example: InputExample) -> FilledPattern:
-        text_a, text_b = self.shortenable(example.text_a), self.shortenable(example.text_b)
-        if self.pattern_id == 0:
-            return [text_a, "？"], ["你是说", text_b, "？", [self.mask], "。"]
-        elif self.pattern_id == 1:
-            return [text_a, "？"], [[self.mask], '，', text_b]
-        else:
-            raise ValueError("No pattern implemented for id {}".format(self.pattern_id))
+        return self._fill_template(example)
 
     def verbalize(self, label) -> List[str]:
         if self.pattern_id == 0 or self.pattern_id == 1:
@@ -1078,23 +1159,19 @@ class YelpPolarityPVP(PVP):
         "2": [" good"]
     }
 
+    PATTERNS = (
+        (['It was', MASK, '.', TEXT_A], []),
+        ([TEXT_A, '. All in all, it was', MASK, '.'], []),
+        (['Just', MASK, "!"], [TEXT_A]),
+        ([TEXT_A], [' In summary, the restaurant is', MASK, '.']),
+    )
+
     @staticmethod
     def available_patterns():
         return [0, 1, 2, 3]
 
     def get_parts(self, example: InputExample) -> FilledPattern:
-        text = self.shortenable(example.text_a)
-
-        if self.pattern_id == 0:
-            return ['It was', [self.mask], '.', text], []
-        elif self.pattern_id == 1:
-            return [text, '. All in all, it was', [self.mask], '.'], []
-        elif self.pattern_id == 2:
-            return ['Just', [self.mask], "!"], [text]
-        elif self.pattern_id == 3:
-            return [text], [' In summary, the restaurant is', [self.mask], '.']
-        else:
-            raise ValueError("No pattern implemented for id {}".format(self.pattern_id))
+        return self._fill_template(example)
 
     def verbalize(self, label) -> List[str]:
         return YelpPolarityPVP.VERBALIZER[label]
@@ -1120,19 +1197,17 @@ class XStancePVP(PVP):
         'fr': {"FAVOR": ["Oui"], "AGAINST": ["Non"]}
     }
 
+    PATTERNS = (
+        (['"', TEXT_A, '"'], [MASK, '. "', TEXT_B, '"']),
+        ([TEXT_A], [MASK, '.', TEXT_B]),
+    ) * 3
+
     @staticmethod
     def available_patterns():
         return [0, 1, 2, 3, 4, 5]
 
     def get_parts(self, example: InputExample) -> FilledPattern:
-
-        text_a = self.shortenable(example.text_a)
-        text_b = self.shortenable(example.text_b)
-
-        if self.pattern_id == 0 or self.pattern_id == 2 or self.pattern_id == 4:
-            return ['"', text_a, '"'], [[self.mask], '. "', text_b, '"']
-        elif self.pattern_id == 1 or self.pattern_id == 3 or self.pattern_id == 5:
-            return [text_a], [[self.mask], '.', text_b]
+        return self._fill_template(example)
 
     def verbalize(self, label) -> List[str]:
         lang = 'de' if self.pattern_id < 2 else 'en' if self.pattern_id < 4 else 'fr'
@@ -1150,16 +1225,16 @@ class Sst2PVP(PVP):
         "1": [" good"]
     }
 
+    PATTERNS = (
+        ([TEXT_A, ' It was', MASK, '.'], []),
+    ) * 2
+
     @staticmethod
     def available_patterns():
         return [0, 1]
 
     def get_parts(self, example: InputExample) -> FilledPattern:
-        text = self.shortenable(example.text_a)
-        if self.pattern_id == 0 or self.pattern_id == 1:
-            return [text, ' It was', [self.mask], '.'], []
-        else:
-            raise ValueError("No pattern implemented for id {}".format(self.pattern_id))
+        return self._fill_template(example)
 
     def verbalize(self, label) -> List[str]:
         if self.pattern_id == 0:
@@ -1174,12 +1249,12 @@ class ColaPVP(PVP):
         "1": [" correct"]
     }
 
+    PATTERNS = (
+        (['"', TEXT_A, '"', " This is", MASK, '.'], []),
+    )
+
     def get_parts(self, example: InputExample) -> FilledPattern:
-        text = self.shortenable(example.text_a)
-        if self.pattern_id == 0:
-            return ['"', text, '"', " This is", [self.mask], '.'], []
-        else:
-            raise ValueError("No pattern implemented for id {}".format(self.pattern_id))
+        return self._fill_template(example)
 
     def verbalize(self, label) -> List[str]:
         return ColaPVP.VERBALIZER[label]
@@ -1387,6 +1462,14 @@ def get_verbalization_ids(word: str, tokenizer, force_single_token: bool) -> Uni
         return ids
 
 
+def _replace_prompt_ids(ids: List[int], prompt_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the ids as an array with the prompt tokens replaced by 0, and the positions of the prompt tokens"""
+    ids = np.array(ids, dtype=np.int64)
+    prompt_pos = np.flatnonzero(ids == prompt_id)
+    ids[prompt_pos] = 0
+    return ids, prompt_pos
+
+
 
 PVPS = {
     'agnews': AgnewsPVP,